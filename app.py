@@ -1,22 +1,51 @@
 import csv
 import datetime
+import functools
 import hashlib
 import json
 import os
 import shutil
 import sqlite3
 import sys
+import threading
 import zipfile
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 
-from PySide6.QtCore import QSize, QStringListModel, Qt, QUrl
+try:
+    import orjson  # 任意。入っていればマニフェストの読み書きに使う
+except ImportError:
+    orjson = None
+
+from PySide6.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
+    QObject,
+    QRunnable,
+    QSize,
+    QSortFilterProxyModel,
+    QStringListModel,
+    Qt,
+    QThread,
+    QThreadPool,
+    QTimer,
+    QUrl,
+    Signal,
+)
 from PySide6.QtGui import (
+    QCloseEvent,
     QColor,
     QDesktopServices,
     QDragEnterEvent,
     QDropEvent,
     QIcon,
+    QImage,
     QImageReader,
+    QImageWriter,
     QKeySequence,
     QPainter,
     QPixmap,
@@ -53,6 +82,12 @@ IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
 DB_PATH = "data/library/db.sqlite3"
 LIB_ROOT = "data/library"
 THUMB_ROOT = Path(LIB_ROOT) / ".thumbnails" / "256"
+THUMB_CACHE_SIZE = 500  # メモリに保持するサムネイルの上限
+CSV_PREVIEW_ROWS = 200  # CSV プレビューで読む先頭行数
+COPY_BUFSIZE = 1024 * 1024  # アーカイブ展開時のコピー単位
+IMPORT_CHUNK_ROWS = 5000  # インポートで 1 トランザクションに書く行数
+# 既に圧縮済みの形式。エクスポート時に deflate し直しても縮まないので無圧縮で格納する
+PRECOMPRESSED_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".mp4", ".gz", ".zip"}
 
 # ---- カテゴリと色対応
 CATEGORY_COLORS: dict[str, QColor] = {
@@ -67,13 +102,36 @@ CATEGORY_COLORS: dict[str, QColor] = {
 
 QUALITY_LABELS = [("good", "良"), ("review", "保留"), ("bad", "悪")]
 
+# 画像ごとの参照で毎回引く列の索引
+# （images.sha256 / tags(name, category) / attachments.sha256 は UNIQUE 制約の索引で足りる）
+INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_attachments_image_kind ON attachments(image_id, kind);
+CREATE INDEX IF NOT EXISTS idx_annotations_image_active ON annotations(image_id) WHERE is_deleted=0;
+"""
+
+# 再スキャン時に中身が変わっていないファイルの sha256 を使い回すためのキャッシュ
+HASH_CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS file_hashes(
+  rel_path TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  sha256 TEXT NOT NULL
+);
+"""
+
 
 def color_dot_icon(color: QColor, size: int = 14) -> QIcon:
+    return _color_dot_icon(color.rgba(), size)
+
+
+# 同じ色・サイズのアイコンは使い回す（QApplication 生成後に呼ぶこと）
+@functools.lru_cache(maxsize=64)
+def _color_dot_icon(rgba: int, size: int) -> QIcon:
     pm = QPixmap(size, size)
     pm.fill(Qt.transparent)
     p = QPainter(pm)
     p.setRenderHint(QPainter.Antialiasing, True)
-    p.setBrush(color)
+    p.setBrush(QColor.fromRgba(rgba))
     p.setPen(Qt.NoPen)
     p.drawEllipse(1, 1, size - 2, size - 2)
     p.end()
@@ -81,11 +139,218 @@ def color_dot_icon(color: QColor, size: int = 14) -> QIcon:
 
 
 def sha256_of(path: Path) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    # 読み込みループごと C 側 (hashlib.file_digest) に任せる
+    with path.open("rb", buffering=0) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _try_sha256(path: Path) -> str | None:
+    try:
+        return sha256_of(path)
+    except Exception as ex:
+        print("hash failed:", path, ex)
+        return None
+
+
+def _scan_dirs(root: Path, skip: Path) -> list[list[os.DirEntry]]:
+    # ディレクトリごとに 1 回だけ scandir し、ファイルの DirEntry をまとめて返す
+    skip_key = os.path.normcase(os.path.abspath(skip))
+    out = []
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                entries = list(it)
+        except OSError as ex:
+            print("scan failed:", d, ex)
+            continue
+        files = []
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                if os.path.normcase(os.path.abspath(e.path)) != skip_key:
+                    stack.append(e.path)
+            elif e.is_file():
+                files.append(e)
+        out.append(files)
+    return out
+
+
+# ---- search bitmasks ----
+def _row_mask(rows: Iterable[int], n: int) -> int:
+    # 行番号の集合を「bit i が行 i」の int にする
+    buf = bytearray((n + 7) // 8)
+    for r in rows:
+        buf[r >> 3] |= 1 << (r & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _mask_rows(mask: int) -> list[int]:
+    bits = bin(mask)[:1:-1]  # 下位ビットから
+    return [i for i, b in enumerate(bits) if b == "1"]
+
+
+# ---- thumbnails ----
+# GUI スレッド外でも作れるよう QPixmap ではなく QImage で返す
+@functools.lru_cache(maxsize=1)
+def _thumb_format() -> tuple[str, str, int]:
+    # (拡張子, 形式, 画質)。WebP は JPEG の半分程度の容量。プラグインが無ければ JPEG のまま
+    formats = {bytes(f).lower() for f in QImageWriter.supportedImageFormats()}
+    if b"webp" in formats:
+        return "webp", "WEBP", 75
+    return "jpg", "JPG", 85
+
+
+def thumbnail_for(path: Path, sha: str, size: int, src_mtime: float) -> QImage:
+    # src_mtime は走査時の stat 結果を渡してもらい、ここではキャッシュ側だけ stat する
+    ext, fmt, quality = _thumb_format()
+    cache = THUMB_ROOT / f"{sha}.{ext}"
+    src_mtime = int(src_mtime)
+    # 旧形式（.jpg）のキャッシュも新しければそのまま使う
+    for cand in dict.fromkeys((cache, THUMB_ROOT / f"{sha}.jpg")):
+        try:
+            c_mtime = int(os.stat(cand).st_mtime)
+        except FileNotFoundError:
+            continue
+        if c_mtime >= src_mtime:
+            img = QImage(str(cand))
+            if not img.isNull():
+                return img
+    canvas = QImage(size, size, QImage.Format_RGB32)
+    canvas.fill(Qt.darkGray)
+    reader = QImageReader(str(path))
+    reader.setAutoTransform(True)
+    img = reader.read()
+    if img.isNull():
+        return canvas
+    scaled = img.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    x = (size - scaled.width()) // 2
+    y = (size - scaled.height()) // 2
+    painter = QPainter(canvas)
+    painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+    painter.drawImage(x, y, scaled)
+    painter.end()
+    try:
+        canvas.save(str(cache), fmt, quality=quality)
+        os.utime(cache, (src_mtime, src_mtime))
+    except Exception:
+        pass
+    return canvas
+
+
+class _ThumbSignals(QObject):
+    done = Signal(int, int, QImage)  # generation, row, thumbnail
+
+
+class ThumbJob(QRunnable):
+    def __init__(
+        self,
+        path: Path,
+        sha: str,
+        mtime: float,
+        size: int,
+        gen: int,
+        row: int,
+        sink: _ThumbSignals,
+    ):
+        super().__init__()
+        self.path = path
+        self.sha = sha
+        self.mtime = mtime
+        self.size = size
+        self.gen = gen
+        self.row = row
+        self.sink = sink
+
+    def run(self):
+        try:
+            img = thumbnail_for(self.path, self.sha, self.size, self.mtime)
+        except Exception as ex:
+            print("thumbnail failed:", self.path, ex)
+            return
+        self.sink.done.emit(self.gen, self.row, img)
+
+
+class GalleryModel(QAbstractListModel):
+    # 行は (rel_path, abs_path, image_id, sha256, mtime)。サムネイルは表示された行だけ読み込み、
+    # 直近 THUMB_CACHE_SIZE 枚を LRU で保持する
+    def __init__(self, thumb_size: int, pool: QThreadPool, parent: QObject | None = None):
+        super().__init__(parent)
+        self.rows: list[tuple[str, str, int, str, float]] = []
+        self.thumb_size = thumb_size
+        self._pool = pool
+        self._cache: OrderedDict[int, QPixmap] = OrderedDict()
+        self._pending: set[int] = set()
+        self._gen = 0
+        self._sink = _ThumbSignals(self)
+        self._sink.done.connect(self._on_thumb_ready)
+        self._placeholder = QPixmap(thumb_size, thumb_size)
+        self._placeholder.fill(Qt.darkGray)
+
+    def reset(self, rows: list[tuple[str, str, int, str, float]]):
+        # 前回分の未着手サムネイルは捨て、実行中のものは世代番号で無視する
+        self.beginResetModel()
+        self._pool.clear()
+        self._gen += 1
+        self.rows = rows
+        self._cache.clear()
+        self._pending.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent: QModelIndex | None = None) -> int:
+        return 0 if parent is not None and parent.isValid() else len(self.rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        rel, abs_path, image_id, _sha, _mtime = self.rows[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return rel
+        if role == Qt.DecorationRole:
+            return self._thumbnail(index.row())
+        if role == Qt.UserRole:
+            return abs_path
+        if role == Qt.UserRole + 1:
+            return image_id
+        return None
+
+    def _thumbnail(self, row: int) -> QPixmap:
+        pm = self._cache.get(row)
+        if pm is not None:
+            self._cache.move_to_end(row)
+            return pm
+        if row not in self._pending:
+            self._pending.add(row)
+            _rel, abs_path, _id, sha, mtime = self.rows[row]
+            self._pool.start(
+                ThumbJob(Path(abs_path), sha, mtime, self.thumb_size, self._gen, row, self._sink)
+            )
+        return self._placeholder
+
+    def _on_thumb_ready(self, gen: int, row: int, img: QImage):
+        if gen != self._gen:
+            return
+        self._pending.discard(row)
+        self._cache[row] = QPixmap.fromImage(img)
+        if len(self._cache) > THUMB_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx, [Qt.DecorationRole])
+
+
+class GalleryFilter(QSortFilterProxyModel):
+    # 検索結果のビットマスクで行を出し入れする。set_mask() ごとに 1 回だけ再フィルタ
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+        self._bits = ""
+
+    def set_mask(self, mask: int):
+        # 行番号で引けるよう、下位ビットから並べた "0"/"1" 文字列にしておく
+        self._bits = bin(mask)[:1:-1]
+        self.invalidateRowsFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        return source_row < len(self._bits) and self._bits[source_row] == "1"
 
 
 # ---- export/import helpers ----
@@ -94,6 +359,23 @@ def _safe_ext(name: str) -> str:
     return ext if ext else ".bin"
 
 
+def _load_manifest(data: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def _dump_manifest(manifest: dict) -> bytes:
+    # どちらも UTF-8 のまま（ensure_ascii=False 相当）、インデント 2
+    if orjson is not None:
+        return orjson.dumps(manifest, option=orjson.OPT_INDENT_2)
+    return json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _zip_compress_type(name: str) -> int:
+    return zipfile.ZIP_STORED if _safe_ext(name) in PRECOMPRESSED_EXTS else zipfile.ZIP_DEFLATED
+
+
 def _ingest_target_dir(root: Path, sub: str) -> Path:
     d = root / sub
     d.mkdir(parents=True, exist_ok=True)
@@ -101,53 +383,165 @@ def _ingest_target_dir(root: Path, sub: str) -> Path:
 
 
 class DB:
+    # 書き込みは self.con（1 本、_write_lock で直列化）、読み取り専用の問い合わせは
+    # スレッドごとの読み取り専用接続 reader() へ流す。WAL なので読みは書きを待たない
     def __init__(self, db_path: str):
-        self.con = sqlite3.connect(db_path)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        # サムネイル/ハッシュを別スレッドへ逃がせるよう check_same_thread=False
+        # トランザクションは transaction() で明示的に張る（それ以外は autocommit）
+        self.con = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, cached_statements=512
+        )
         self.con.row_factory = sqlite3.Row
         self.con.execute("PRAGMA foreign_keys=ON")
+        self.con.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-65536;
+            PRAGMA mmap_size=268435456;
+            PRAGMA busy_timeout=5000;
+            """
+        )
+        self.con.executescript(INDEX_DDL)
+        self.con.executescript(HASH_CACHE_DDL)
+
+    def analyze_if_needed(self):
+        # 統計が無いとプランナが索引を選ばないことがあるので、データが入った後に
+        # sqlite_stat1 が空（空の DB で ANALYZE しても行は増えない）なら ANALYZE
+        with self._write_lock:
+            has_stat = self.con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"
+            ).fetchone()
+            if has_stat and self.con.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0]:
+                return
+            self.con.execute("ANALYZE")
+
+    def close(self):
+        # 書き込み接続と、呼び出したスレッドの読み取り接続を閉じる
+        # 閉じる前に PRAGMA optimize で、使われ方が変わった表の統計だけ更新する
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+        with self._write_lock:
+            self.con.execute("PRAGMA optimize")
+        self.con.close()
+
+    # --- transactions ---
+    # 書き込みは呼び出し側でまとめて 1 トランザクションにする（入れ子は外側に合流）
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        with self._write_lock:
+            if self.con.in_transaction:
+                yield self.con
+                return
+            self.con.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield self.con
+            except BaseException:
+                self.con.rollback()
+                raise
+            self.con.commit()
+
+    def reader(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            con = sqlite3.connect(uri, uri=True, isolation_level=None, cached_statements=512)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA busy_timeout=5000")
+            self._local.con = con
+        return con
+
+    # --- hash cache ---
+    def cached_hashes(self) -> dict[str, tuple[int, int, str]]:
+        # rel_path -> (size, mtime_ns, sha256)
+        q = "SELECT rel_path, size, mtime_ns, sha256 FROM file_hashes"
+        return {r[0]: (r[1], r[2], r[3]) for r in self.reader().execute(q)}
+
+    def store_hashes(self, rows: list[tuple[str, int, int, str]]):
+        self.con.executemany(
+            "INSERT OR REPLACE INTO file_hashes(rel_path, size, mtime_ns, sha256) VALUES(?,?,?,?)",
+            rows,
+        )
+
+    def drop_hashes(self, rel_paths: Iterable[str]):
+        self.con.executemany("DELETE FROM file_hashes WHERE rel_path=?", ((r,) for r in rel_paths))
 
     # --- users ---
+    # upsert 系は 1 文で挿入と id の取得を済ませる（SQLite 3.35+ の RETURNING）
     def ensure_user(self, username: str, display_name: str | None = None) -> int:
-        r = self.con.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
-        if r:
-            return r["id"]
-        cur = self.con.execute(
-            "INSERT INTO users(username, display_name) VALUES(?,?)",
+        return self.con.execute(
+            "INSERT INTO users(username, display_name) VALUES(?,?) "
+            "ON CONFLICT(username) DO UPDATE SET username=excluded.username RETURNING id",
             (username, display_name),
+        ).fetchone()[0]
+
+    def ensure_users(self, users: dict[str, str | None]) -> dict[str, int]:
+        # users: username -> display_name（None なら既存の表示名を残す）。戻り値は username -> id
+        self.con.executemany(
+            "INSERT INTO users(username, display_name) VALUES(?,?) "
+            "ON CONFLICT(username) DO UPDATE "
+            "SET display_name=COALESCE(excluded.display_name, users.display_name)",
+            users.items(),
         )
-        self.con.commit()
-        return cur.lastrowid
+        return {r["username"]: r["id"] for r in self.con.execute("SELECT id, username FROM users")}
 
     # --- images ---
     def upsert_image(self, rel_path: str, sha256: str, created_at: str | None) -> int:
-        r = self.con.execute("SELECT id FROM images WHERE sha256=?", (sha256,)).fetchone()
-        if r:
-            self.con.execute("UPDATE images SET rel_path=? WHERE id=?", (rel_path, r["id"]))
-            self.con.commit()
-            return r["id"]
-        cur = self.con.execute(
-            "INSERT INTO images(rel_path, sha256, created_at) VALUES(?,?,?)",
+        return self.con.execute(
+            "INSERT INTO images(rel_path, sha256, created_at) VALUES(?,?,?) "
+            "ON CONFLICT(sha256) DO UPDATE SET rel_path=excluded.rel_path RETURNING id",
             (rel_path, sha256, created_at),
+        ).fetchone()[0]
+
+    def upsert_images(self, rows: list[tuple[str, str, str | None]]) -> dict[str, int]:
+        # rows: (rel_path, sha256, created_at)。戻り値は sha256 -> id
+        self.con.executemany(
+            "INSERT INTO images(rel_path, sha256, created_at) VALUES(?,?,?) "
+            "ON CONFLICT(sha256) DO UPDATE SET rel_path=excluded.rel_path",
+            rows,
         )
-        self.con.commit()
-        return cur.lastrowid
+        return {r["sha256"]: r["id"] for r in self.con.execute("SELECT id, sha256 FROM images")}
+
+    def image_ids_by_sha(self, shas: Iterable[str]) -> dict[str, int]:
+        # IN 句のパラメータ数の上限に掛からないよう 500 件ずつ引く
+        shas = list(dict.fromkeys(shas))
+        ids: dict[str, int] = {}
+        for i in range(0, len(shas), 500):
+            chunk = shas[i : i + 500]
+            q = f"SELECT id, sha256 FROM images WHERE sha256 IN ({','.join('?' * len(chunk))})"
+            ids.update({r["sha256"]: r["id"] for r in self.con.execute(q, chunk)})
+        return ids
 
     # --- tags ---
     def upsert_tag(self, name: str, category: str = "", description: str | None = None) -> int:
-        r = self.con.execute(
-            "SELECT id FROM tags WHERE name=? AND category=?", (name, category)
-        ).fetchone()
-        if r:
-            return r["id"]
-        cur = self.con.execute(
-            "INSERT INTO tags(name, category, description) VALUES(?,?,?)",
+        return self.con.execute(
+            "INSERT INTO tags(name, category, description) VALUES(?,?,?) "
+            "ON CONFLICT(name, category) DO UPDATE SET name=excluded.name RETURNING id",
             (name, category, description),
+        ).fetchone()[0]
+
+    def upsert_tags(self, tags: dict[tuple[str, str], str | None]) -> dict[tuple[str, str], int]:
+        # tags: (name, category) -> description（None なら既存の説明を残す）
+        # 戻り値は (name, category) -> id
+        self.con.executemany(
+            "INSERT INTO tags(name, category, description) VALUES(?,?,?) "
+            "ON CONFLICT(name, category) DO UPDATE "
+            "SET description=COALESCE(excluded.description, tags.description)",
+            [(name, cat, desc) for (name, cat), desc in tags.items()],
         )
-        self.con.commit()
-        return cur.lastrowid
+        q = "SELECT id, name, category FROM tags"
+        return {(r["name"], r["category"]): r["id"] for r in self.con.execute(q)}
 
     def all_tag_names(self) -> list[str]:
-        return [r["name"] for r in self.con.execute("SELECT DISTINCT name FROM tags ORDER BY name")]
+        return [
+            r["name"] for r in self.reader().execute("SELECT DISTINCT name FROM tags ORDER BY name")
+        ]
 
     # --- annotations ---
     def get_tags_for_image(self, image_id: int) -> list[sqlite3.Row]:
@@ -159,7 +553,7 @@ class DB:
          WHERE a.image_id=? AND a.is_deleted=0
          ORDER BY t.category, t.name
         """
-        return list(self.con.execute(q, (image_id,)))
+        return list(self.reader().execute(q, (image_id,)))
 
     def add_tag_for_user(self, image_id: int, tag_name: str, user_id: int, category: str = ""):
         tag_id = self.upsert_tag(tag_name, category)
@@ -179,7 +573,55 @@ class DB:
                 "INSERT INTO annotations(image_id, tag_id, user_id, created_at, is_deleted) VALUES(?,?,?,?,0)",
                 (image_id, tag_id, user_id, now),
             )
-        self.con.commit()
+
+    def add_annotations(self, rows: list[tuple[int, int, int]]):
+        # rows: (image_id, tag_id, user_id)。add_tag_for_user と同じく削除済みは復活、無ければ追加
+        # 上限トリガー（1 行ごとに COUNT(DISTINCT) する）は投入中だけ外す。その代わり先に
+        # over_limit_images で同じ規則を検査し、違反があれば何も書かずに例外にする
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.transaction():
+            trigger = self.con.execute(
+                "SELECT sql FROM sqlite_master WHERE type='trigger' AND name='trg_limit_annotators'"
+            ).fetchone()
+            if trigger is not None:
+                over = self.over_limit_images(rows)
+                if over:
+                    ids = ", ".join(map(str, sorted(over)))
+                    raise sqlite3.IntegrityError(f"Max 5 annotators per image (image_id={ids})")
+                self.con.execute("DROP TRIGGER trg_limit_annotators")
+            self.con.executemany(
+                "INSERT INTO annotations(image_id, tag_id, user_id, created_at, is_deleted) "
+                "VALUES(?,?,?,?,0) ON CONFLICT(image_id, tag_id, user_id) DO UPDATE "
+                "SET is_deleted=0, created_at=excluded.created_at WHERE annotations.is_deleted<>0",
+                [(*r, now) for r in rows],
+            )
+            if trigger is not None:
+                self.con.execute(trigger["sql"])
+
+    def over_limit_images(self, rows: list[tuple[int, int, int]]) -> set[int]:
+        # rows を順に add_tag_for_user したとき trg_limit_annotators に弾かれる画像を返す
+        # トリガーと同じく、新規の行だけを「その時点で 5 人以上が付けていれば拒否」で数える
+        # （既存行と削除済みの復活は UPDATE なので対象外）
+        existing = set()
+        users: dict[int, set[int]] = {}
+        for r in self.con.execute(
+            "SELECT image_id, tag_id, user_id, is_deleted FROM annotations "
+            "WHERE image_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted({r[0] for r in rows})),),
+        ):
+            existing.add((r[0], r[1], r[2]))
+            if r[3] == 0:
+                users.setdefault(r[0], set()).add(r[2])
+        over = set()
+        for image_id, tag_id, user_id in rows:
+            active = users.setdefault(image_id, set())
+            if (image_id, tag_id, user_id) not in existing:
+                if len(active) >= 5:
+                    over.add(image_id)
+                    continue
+                existing.add((image_id, tag_id, user_id))
+            active.add(user_id)
+        return over
 
     def remove_tag_for_user(self, image_id: int, tag_name: str, user_id: int, category: str = ""):
         r = self.con.execute(
@@ -193,18 +635,26 @@ class DB:
             "UPDATE annotations SET is_deleted=1, created_at=? WHERE image_id=? AND tag_id=? AND user_id=?",
             (now, image_id, tag_id, user_id),
         )
-        self.con.commit()
 
     def active_tags_map(self) -> dict[int, set[str]]:
-        m: dict[int, set[str]] = {}
+        # 画像ごとに 1 行へ集約して返す（区切りは US 制御文字）
         q = """
-        SELECT a.image_id, t.name
+        SELECT a.image_id, group_concat(t.name, char(31))
           FROM annotations a JOIN tags t ON t.id=a.tag_id
          WHERE a.is_deleted=0
+         GROUP BY a.image_id
         """
-        for r in self.con.execute(q):
-            m.setdefault(r["image_id"], set()).add(r["name"])
-        return m
+        return {r[0]: set(r[1].split("\x1f")) for r in self.reader().execute(q)}
+
+    def all_active_annotations(self) -> sqlite3.Cursor:
+        q = """
+        SELECT a.image_id, t.name, t.category, u.username
+          FROM annotations a
+          JOIN tags t ON t.id=a.tag_id
+          JOIN users u ON u.id=a.user_id
+         WHERE a.is_deleted=0
+        """
+        return self.reader().execute(q)
 
     # --- attachments ---
     def upsert_attachment(
@@ -222,12 +672,26 @@ class DB:
             "INSERT INTO attachments(image_id, kind, rel_path, sha256, created_at) VALUES(?,?,?,?,?)",
             (image_id, kind, rel_path, sha256, created_at),
         )
-        self.con.commit()
         return cur.lastrowid
 
+    def upsert_attachments(self, rows: list[tuple[int, str, str, str, str | None]]):
+        # rows: (image_id, kind, rel_path, sha256, created_at)。既存の sha256 はそのまま
+        self.con.executemany(
+            "INSERT INTO attachments(image_id, kind, rel_path, sha256, created_at) VALUES(?,?,?,?,?) "
+            "ON CONFLICT(sha256) DO NOTHING",
+            rows,
+        )
+
+    def attachment_shas(self) -> set[str]:
+        return {r[0] for r in self.con.execute("SELECT sha256 FROM attachments")}
+
     def get_csv_attachments(self, image_id: int):
         q = "SELECT id, rel_path FROM attachments WHERE image_id=? AND kind='csv' ORDER BY rel_path"
-        return list(self.con.execute(q, (image_id,)))
+        return list(self.reader().execute(q, (image_id,)))
+
+    def image_ids_with_csv(self) -> set[int]:
+        q = "SELECT image_id FROM attachments WHERE kind='csv' GROUP BY image_id"
+        return {r["image_id"] for r in self.reader().execute(q)}
 
     # --- quality votes ---
     def upsert_quality(
@@ -243,7 +707,14 @@ class DB:
             "INSERT OR REPLACE INTO quality_votes(image_id,user_id,label,score,created_at) VALUES(?,?,?,?,?)",
             (image_id, user_id, label, score, when),
         )
-        self.con.commit()
+
+    def upsert_qualities(self, rows: list[tuple[int, int, str, float | None, str | None]]):
+        # rows: (image_id, user_id, label, score, created_at)
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        self.con.executemany(
+            "INSERT OR REPLACE INTO quality_votes(image_id,user_id,label,score,created_at) VALUES(?,?,?,?,?)",
+            [(i, u, lb, sc, when or now) for i, u, lb, sc, when in rows],
+        )
 
     def get_quality_for_image(self, image_id: int) -> list[sqlite3.Row]:
         q = """
@@ -251,7 +722,148 @@ class DB:
           FROM quality_votes q JOIN users u ON u.id=q.user_id
          WHERE q.image_id=? ORDER BY q.created_at DESC
         """
-        return list(self.con.execute(q, (image_id,)))
+        return list(self.reader().execute(q, (image_id,)))
+
+    def all_quality_labels(self) -> sqlite3.Cursor:
+        return self.reader().execute("SELECT image_id, label FROM quality_votes")
+
+    # --- export ---
+    def select_images(self, ids: Iterable[int]):
+        # 対象の image_id を一時テーブル _sel に入れ、以降は種類ごとに 1 回 "IN _sel" で引く
+        # （一時テーブルは接続ごとなので、続く問い合わせも self.con で行う）
+        with self.transaction():
+            self.con.execute("CREATE TEMP TABLE IF NOT EXISTS _sel(id INTEGER PRIMARY KEY)")
+            self.con.execute("DELETE FROM _sel")
+            self.con.executemany("INSERT OR IGNORE INTO _sel(id) VALUES(?)", ((i,) for i in ids))
+
+
+class _ImportWorker(QObject):
+    # アーカイブのインポートを別スレッドで行う。DB は自前の接続を開き、終わったら閉じる
+    progress = Signal(int, int)  # 処理済みの画像数, 全画像数
+    finished = Signal()
+    failed = Signal(str)
+
+    def __init__(self, path: str, root: Path, db_path: str):
+        super().__init__()
+        self.path = path
+        self.root = root
+        self.db_path = db_path
+
+    def run(self):
+        db = DB(self.db_path)
+        try:
+            with zipfile.ZipFile(self.path, "r") as z:
+                try:
+                    manifest = _load_manifest(z.read("manifest.json"))
+                except Exception as e:
+                    self.failed.emit(f"manifest.json が読めません: {e}")
+                    return
+                skipped = self._import(db, z, manifest)
+        except Exception as ex:
+            self.failed.emit(f"インポート失敗: {ex}")
+            return
+        finally:
+            db.close()
+        if skipped:
+            self.failed.emit(
+                "注釈者が 1 画像 5 人の上限を超えるため、次の画像の注釈は取り込みませんでした"
+                "（他は書き込み済み）:\n" + "\n".join(skipped)
+            )
+            return
+        self.finished.emit()
+
+    def _import(self, db: DB, z: zipfile.ZipFile, manifest: dict):
+        names = set(z.namelist())
+
+        # 1) ファイルのコピーはトランザクションの外で済ませる（書き込みロックを握ったまま
+        #    展開すると、その間 GUI 側の書き込みが busy_timeout で待たされる）
+        images = manifest.get("images", [])
+        image_ids = db.image_ids_by_sha(im["sha256"] for im in images)
+        known_atts = db.attachment_shas()
+        new_images: dict[str, tuple[str, str, str | None]] = {}
+        placed_shas = []
+        new_atts = []  # (画像の sha256, kind, rel_path, 添付の sha256)
+        for i, im in enumerate(images):
+            self.progress.emit(i, len(images))
+            sha = im["sha256"]
+            if sha not in image_ids and sha not in new_images:
+                member = f"images/{sha}{_safe_ext(im.get('rel_path', ''))}"
+                if member not in names:
+                    continue
+                dst_dir = _ingest_target_dir(self.root, "imported")
+                dst = dst_dir / Path(member).name
+                with z.open(member) as src, open(dst, "wb") as out:
+                    shutil.copyfileobj(src, out, COPY_BUFSIZE)
+                rel = dst.relative_to(self.root).as_posix()
+                new_images[sha] = (rel, sha, im.get("created_at"))
+            placed_shas.append((sha, im))
+            for att in im.get("attachments", []):
+                a_sha, ext = att["sha256"], att.get("ext", ".bin")
+                if a_sha not in known_atts and f"attachments/{a_sha}{ext}" in names:
+                    dst_dir = _ingest_target_dir(self.root, "attachments_imported")
+                    dst = dst_dir / f"{a_sha}{ext}"
+                    with z.open(f"attachments/{a_sha}{ext}") as src, open(dst, "wb") as out:
+                        shutil.copyfileobj(src, out, COPY_BUFSIZE)
+                    rel = dst.relative_to(self.root).as_posix()
+                    known_atts.add(a_sha)
+                    new_atts.append((sha, att.get("kind", "csv"), rel, a_sha))
+
+        # 2) 画像・ユーザー・タグの登録と id の解決を 1 トランザクションで済ませ、
+        #    注釈・品質・添付は行を溜める。ループ内は dict を引くだけ
+        with db.transaction(immediate=True):
+            if new_images:
+                image_ids = db.upsert_images(list(new_images.values()))
+            placed = [(image_ids[sha], im) for sha, im in placed_shas]
+
+            users: dict[str, str | None] = {}
+            for u in manifest.get("users", []):
+                users.setdefault(u.get("username"), u.get("display_name"))
+            tags: dict[tuple[str, str], str | None] = {}
+            for t in manifest.get("tags", []):
+                tags.setdefault((t.get("name", ""), t.get("category", "")), t.get("description"))
+            for _img_id, im in placed:
+                for an in im.get("annotations", []):
+                    users.setdefault(an.get("username"), None)
+                    tags.setdefault((an.get("tag", ""), an.get("category", "")), None)
+                for q in im.get("quality", []):
+                    users.setdefault(q.get("username"), None)
+            user_ids = db.ensure_users(users)
+            tag_ids = db.upsert_tags(tags)
+
+        att_rows = [(image_ids[sha], kind, rel, a_sha, None) for sha, kind, rel, a_sha in new_atts]
+        ann_rows = []
+        quality_rows = []
+        for img_id, im in placed:
+            for an in im.get("annotations", []):
+                tag_id = tag_ids[(an.get("tag", ""), an.get("category", ""))]
+                ann_rows.append((img_id, tag_id, user_ids[an.get("username")]))
+            for q in im.get("quality", []):
+                quality_rows.append(
+                    (
+                        img_id,
+                        user_ids[q.get("username")],
+                        q.get("label", "review"),
+                        q.get("score"),
+                        q.get("created_at"),
+                    )
+                )
+
+        # 溜めた行は IMPORT_CHUNK_ROWS 行ずつコミットし、未コミットのページをキャッシュ内に収める
+        for write, rows in ((db.upsert_attachments, att_rows), (db.upsert_qualities, quality_rows)):
+            for i in range(0, len(rows), IMPORT_CHUNK_ROWS):
+                with db.transaction(immediate=True):
+                    write(rows[i : i + IMPORT_CHUNK_ROWS])
+        # 注釈は 1 画像 5 人の上限に掛かる画像の行だけを外して書く（同じチャンクの他の画像は
+        # 巻き添えにしない）。外した画像は以降のチャンクでも外し、最後にまとめて返す
+        skipped: set[int] = set()
+        for i in range(0, len(ann_rows), IMPORT_CHUNK_ROWS):
+            chunk = [r for r in ann_rows[i : i + IMPORT_CHUNK_ROWS] if r[0] not in skipped]
+            with db.transaction(immediate=True):
+                over = db.over_limit_images(chunk)
+                db.add_annotations([r for r in chunk if r[0] not in over])
+            skipped |= over
+        rel_of = {img_id: im.get("rel_path", "") for img_id, im in placed}
+        return [f"{rel_of[img_id]} (image_id={img_id})" for img_id in sorted(skipped)]
 
 
 class MainWindow(QMainWindow):
@@ -270,11 +882,18 @@ class MainWindow(QMainWindow):
         self.search = QLineEdit(
             placeholderText="検索: 例/#tag cat:result user:kager label:good has:csv date:2025-06-01..2025-06-30"
         )
-        self.list = QListWidget()
+        # サムネイルはスレッドプールで作り、表示中の行だけ順に差し替える
+        self.thumb_pool = QThreadPool(self)
+        self.thumb_pool.setMaxThreadCount(os.cpu_count() or 1)
+        self.gallery = GalleryModel(self.thumb_size, self.thumb_pool, self)
+        self.gallery_filter = GalleryFilter(self)
+        self.gallery_filter.setSourceModel(self.gallery)
+        self.list = QListView()
+        self.list.setModel(self.gallery_filter)
         self.list.setViewMode(QListView.IconMode)
-        self.list.setResizeMode(QListWidget.Adjust)
+        self.list.setResizeMode(QListView.Adjust)
         self.list.setUniformItemSizes(True)
-        self.list.setMovement(QListWidget.Static)
+        self.list.setMovement(QListView.Static)
         self.list.setIconSize(QSize(self.thumb_size, self.thumb_size))
         self.list.setGridSize(QSize(self.thumb_size + 20, self.thumb_size + 40))
         self.list.setSpacing(8)
@@ -384,40 +1003,55 @@ class MainWindow(QMainWindow):
         self.resize(1320, 900)
 
         # events
-        self.search.textChanged.connect(self.on_search)
-        self.list.itemDoubleClicked.connect(self.open_item)
-        self.list.itemSelectionChanged.connect(self.update_right_panel)
+        # 打鍵ごとではなく入力が 120ms 止まってから 1 回だけ検索する
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(120)
+        self._search_timer.timeout.connect(lambda: self.on_search(self.search.text()))
+        self.search.textChanged.connect(lambda _text: self._search_timer.start())
+        self.list.doubleClicked.connect(self.open_item)
+        self.list.selectionModel().selectionChanged.connect(lambda *_: self.update_right_panel())
         self.btn_add.clicked.connect(self.add_tag_clicked)
         self.btn_del.clicked.connect(self.del_tag_clicked)
         # quality
         self.btn_q_good.clicked.connect(lambda: self.vote_quality("good"))
         self.btn_q_review.clicked.connect(lambda: self.vote_quality("review"))
         self.btn_q_bad.clicked.connect(lambda: self.vote_quality("bad"))
-        QShortcut(QKeySequence("1"), self, activated=lambda: self.vote_quality("good"))
-        QShortcut(QKeySequence("2"), self, activated=lambda: self.vote_quality("review"))
-        QShortcut(QKeySequence("3"), self, activated=lambda: self.vote_quality("bad"))
+        self._write_shortcuts = [
+            QShortcut(QKeySequence("1"), self, activated=lambda: self.vote_quality("good")),
+            QShortcut(QKeySequence("2"), self, activated=lambda: self.vote_quality("review")),
+            QShortcut(QKeySequence("3"), self, activated=lambda: self.vote_quality("bad")),
+        ]
         # CSV
         self.btn_rescan.clicked.connect(self._rescan)
         self.btn_attach.clicked.connect(self.attach_csv_manual)
         self.btn_export.clicked.connect(lambda: self.export_selection(True, True))
         self.btn_import.clicked.connect(self.import_archive)
-        QShortcut(QKeySequence.Refresh, self, activated=self._rescan)  # F5
+        self._write_shortcuts.append(
+            QShortcut(QKeySequence.Refresh, self, activated=self._rescan)  # F5
+        )
         self.csv_list.itemDoubleClicked.connect(self.open_csv_item)
         self.csv_list.currentItemChanged.connect(self.preview_csv)
 
         # D&D
         self.setAcceptDrops(True)
+        self._import_thread: QThread | None = None
+
+        for col in CATEGORY_COLORS.values():
+            color_dot_icon(col)
 
         # data
-        self.all_items: list[tuple[str, QListWidgetItem]] = []
         self.image_tags: dict[int, set[str]] = {}
-        # 検索用のインデックス
-        self.map_tags_lower: dict[int, set[str]] = {}
-        self.map_cats: dict[int, set[str]] = {}
-        self.map_users: dict[int, set[str]] = {}
-        self.map_labels: dict[int, set[str]] = {}
-        self.map_has_csv: dict[int, bool] = {}
-        self.map_created_at: dict[int, datetime.datetime] = {}
+        # 検索用のインデックス：ギャラリーの行番号で引く列と、
+        # 値 -> 行のビットマスク（int の bit i が行 i）の転置インデックス
+        self.row_image_ids: list[int] = []
+        self.row_names_lower: list[str] = []
+        self.row_created_at: list[datetime.datetime] = []
+        self.tag_rows: dict[str, int] = {}
+        self.cat_rows: dict[str, int] = {}
+        self.user_rows: dict[str, int] = {}
+        self.label_rows: dict[str, int] = {}
+        self.csv_mask = 0
 
         self.reload_all()
 
@@ -425,7 +1059,7 @@ class MainWindow(QMainWindow):
         self.completer_model = QStringListModel(self.db.all_tag_names())
         self.tag_input.setCompleter(QCompleter(self.completer_model))
         all_tags = self.db.all_tag_names()
-        all_files = [rel for rel, _ in self.all_items]
+        all_files = [row[0] for row in self.gallery.rows]
         ops = ["#", "cat:", "user:", "label:", "has:csv", "date:"]
         self.search_completer = QCompleter(ops + all_tags + ["#" + t for t in all_tags] + all_files)
         self.search_completer.setCaseSensitivity(Qt.CaseInsensitive)
@@ -433,7 +1067,7 @@ class MainWindow(QMainWindow):
 
     # ===== D&D handlers =====
     def dragEnterEvent(self, e: QDragEnterEvent):
-        if e.mimeData().hasUrls():
+        if self._import_thread is None and e.mimeData().hasUrls():
             urls = [u.toLocalFile() for u in e.mimeData().urls()]
             if any(Path(p).suffix.lower() == ".csv" for p in urls):
                 e.acceptProposedAction()
@@ -455,7 +1089,7 @@ class MainWindow(QMainWindow):
         self.update_right_panel()
         # 検索候補の更新
         all_tags = self.db.all_tag_names()
-        all_files = [rel for rel, _ in self.all_items]
+        all_files = [row[0] for row in self.gallery.rows]
         ops = ["#", "cat:", "user:", "label:", "has:csv", "date:"]
         self.search_completer.model().setStringList(
             ops + all_tags + ["#" + t for t in all_tags] + all_files
@@ -468,6 +1102,10 @@ class MainWindow(QMainWindow):
                 self, "DateNest", "画像を選択してから CSV をドロップしてください。"
             )
             return
+        # コピーとハッシュはトランザクションの外で済ませ、書き込みだけをまとめる
+        # ダイアログも書き込みロックを放してから出す
+        rows = []
+        errors = []
         for it in items:
             img_abs = Path(it.data(Qt.UserRole))
             img_id = it.data(Qt.UserRole + 1)
@@ -488,9 +1126,13 @@ class MainWindow(QMainWindow):
                     cts = datetime.datetime.fromtimestamp(csv_abs.stat().st_mtime).isoformat(
                         timespec="seconds"
                     )
-                    self.db.upsert_attachment(img_id, "csv", rel_csv, csha, cts)
+                    rows.append((img_id, "csv", rel_csv, csha, cts))
                 except Exception as ex:
-                    QMessageBox.warning(self, "DateNest", f"CSV 添付に失敗: {p}{ex}")
+                    errors.append(f"CSV 添付に失敗: {p}{ex}")
+        with self.db.transaction():
+            self.db.upsert_attachments(rows)
+        for msg in errors:
+            QMessageBox.warning(self, "DateNest", msg)
         self.update_right_panel()
 
     # ===== quality vote =====
@@ -501,129 +1143,155 @@ class MainWindow(QMainWindow):
             return
         if label not in {"good", "review", "bad"}:
             return
-        for it in items:
-            image_id = it.data(Qt.UserRole + 1)
-            self.db.upsert_quality(image_id, self.user_id, label)
+        with self.db.transaction():
+            for image_id in self.selected_image_ids():
+                self.db.upsert_quality(image_id, self.user_id, label)
         self.update_right_panel()
 
     # ===== load & thumbnails =====
     def reload_all(self):
-        self.list.clear()
-        self.all_items.clear()
-        paths = []
-        for p in Path(self.root).rglob("*"):
-            if p.suffix.lower() not in IMAGE_EXTS:
-                continue
-            if THUMB_ROOT in p.parents:
-                continue
-            paths.append(p)
-        paths.sort(key=lambda p: p.name.lower())
-
-        self.map_tags_lower.clear()
-        self.map_cats.clear()
-        self.map_users.clear()
-        self.map_labels.clear()
-        self.map_has_csv.clear()
-        self.map_created_at.clear()
-
-        for p in paths:
-            rel = p.relative_to(self.root).as_posix()
+        # 1) ディレクトリごとに 1 回だけ列挙し、画像と CSV 自動紐づけ候補（強化版）を集める
+        found: list[tuple[os.DirEntry, list[os.DirEntry]]] = []
+        for files in _scan_dirs(self.root, THUMB_ROOT):
+            csvs = {e.name.lower(): e for e in files if e.name.lower().endswith(".csv")}
+            for e in files:
+                stem, ext = os.path.splitext(e.name.lower())
+                if ext not in IMAGE_EXTS:
+                    continue
+                cands = [csvs[stem + ".csv"]] if stem + ".csv" in csvs else []
+                if not cands and len(csvs) == 1:
+                    cands = list(csvs.values())
+                if not cands:
+                    cands = [c for n, c in csvs.items() if n.startswith(stem + "_")]
+                found.append((e, cands))
+        found.sort(key=lambda f: f[0].name.lower())
+
+        # scandir の path は self.root で始まるので、相対パスは文字列の切り出しで作る
+        root_prefix = os.path.join(str(self.root), "")
+        stats: dict[Path, os.stat_result] = {}
+        rels: dict[Path, str] = {}
+        csv_cands: dict[Path, list[Path]] = {}
+        for e, cands in found:
+            p = Path(e.path)
             try:
-                sha = sha256_of(p)
-            except Exception as ex:
-                print("hash failed:", p, ex)
+                stats[p] = e.stat()
+            except OSError as ex:
+                print("stat failed:", p, ex)
                 continue
-            mtime = p.stat().st_mtime
-            ts = datetime.datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
-            image_id = self.db.upsert_image(rel, sha, ts)
-
-            # --- CSV 自動紐づけ（強化版） ---
-            stem = p.stem
-            parent = p.parent
-            cands = list(parent.glob(stem + ".csv"))
-            if not cands:
-                only_csv = list(parent.glob("*.csv"))
-                if len(only_csv) == 1:
-                    cands = only_csv
-            if not cands:
-                cands = list(parent.glob(stem + "_*.csv"))
-                if len(cands) > 1:
-                    cands.sort(key=lambda x: abs(x.stat().st_mtime - mtime))
-                    cands = [cands[0]]
-            for cand in cands:
+            rels[p] = e.path[len(root_prefix) :].replace(os.sep, "/")
+            mtime = stats[p].st_mtime
+            csv_cands[p] = []
+            for c in cands:
+                cp = Path(c.path)
                 try:
-                    csha = sha256_of(cand)
-                    rel_csv = cand.relative_to(self.root).as_posix()
-                    cts = datetime.datetime.fromtimestamp(cand.stat().st_mtime).isoformat(
+                    stats[cp] = c.stat()
+                except OSError as ex:
+                    print("stat failed:", c.path, ex)
+                    continue
+                rels[cp] = c.path[len(root_prefix) :].replace(os.sep, "/")
+                csv_cands[p].append(cp)
+            if len(csv_cands[p]) > 1:
+                csv_cands[p] = [min(csv_cands[p], key=lambda x: abs(stats[x].st_mtime - mtime))]
+        mtimes = {p: stats[p].st_mtime for p in csv_cands}
+
+        # 2) ハッシュ：(rel_path, size, mtime) が前回と同じならキャッシュを使い、
+        #    残りだけスレッドで並列に計算（ファイル I/O と sha256 の間は GIL が外れる）
+        #    stat は候補 CSV 全部に取るが、ハッシュは画像と選ばれた CSV だけ
+        cached = self.db.cached_hashes()
+        shas: dict[Path, str | None] = dict.fromkeys(csv_cands)
+        for cands in csv_cands.values():
+            shas.update(dict.fromkeys(cands))
+        stale = []
+        for p in shas:
+            st = stats[p]
+            rel = rels[p]
+            hit = cached.get(rel)
+            if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+                shas[p] = hit[2]
+            else:
+                stale.append((p, rel, st))
+        hash_rows = []
+        with ThreadPoolExecutor() as ex:
+            for (p, rel, st), sha in zip(
+                stale, ex.map(_try_sha256, [s[0] for s in stale]), strict=True
+            ):
+                shas[p] = sha
+                if sha is not None:
+                    hash_rows.append((rel, st.st_size, st.st_mtime_ns, sha))
+
+        # 3) 画像 → 添付の順にまとめて書き込む
+        image_rows = []
+        for p, mtime in mtimes.items():
+            sha = shas[p]
+            if sha is None:
+                continue
+            ts = datetime.datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
+            image_rows.append((rels[p], sha, ts))
+        # 今回のスキャンに出てこなかったパス（削除・移動されたファイル）のキャッシュは捨てる
+        gone = cached.keys() - {rels[p] for p in shas}
+        with self.db.transaction(immediate=True):
+            self.db.store_hashes(hash_rows)
+            self.db.drop_hashes(gone)
+            ids = self.db.upsert_images(image_rows)
+            att_rows = []
+            for p, cands in csv_cands.items():
+                if shas[p] is None:
+                    continue
+                for cand in cands:
+                    csha = shas[cand]
+                    if csha is None:
+                        continue
+                    cts = datetime.datetime.fromtimestamp(stats[cand].st_mtime).isoformat(
                         timespec="seconds"
                     )
-                    self.db.upsert_attachment(image_id, "csv", rel_csv, csha, cts)
-                except Exception as ex:
-                    print("attach csv failed:", cand, ex)
-
-            # UI item
-            it = QListWidgetItem(rel)
-            it.setToolTip(rel)
-            it.setIcon(QIcon(self.thumbnail_for(p, sha)))
-            it.setData(Qt.UserRole, str(p))
-            it.setData(Qt.UserRole + 1, image_id)
-            self.list.addItem(it)
-            self.all_items.append((rel, it))
-
-            # 検索インデックス
-            tag_rows = self.db.get_tags_for_image(image_id)
-            self.map_tags_lower[image_id] = {r["name"].lower() for r in tag_rows}
-            self.map_cats[image_id] = {(r["category"] or "").lower() for r in tag_rows}
-            self.map_users[image_id] = {r["username"].lower() for r in tag_rows}
-            self.map_labels[image_id] = {
-                r["label"].lower() for r in self.db.get_quality_for_image(image_id)
-            }
-            self.map_has_csv[image_id] = len(self.db.get_csv_attachments(image_id)) > 0
-            self.map_created_at[image_id] = datetime.datetime.fromtimestamp(mtime)
+                    att_rows.append((ids[shas[p]], "csv", rels[cand], csha, cts))
+            self.db.upsert_attachments(att_rows)
+        self.db.analyze_if_needed()
+
+        rows = []
+        self.row_created_at = []
+        for p, mtime in mtimes.items():
+            sha = shas[p]
+            if sha is None:
+                continue
+            rows.append((rels[p], str(p), ids[sha], sha, mtime))
+            self.row_created_at.append(datetime.datetime.fromtimestamp(mtime))
+        self.gallery_filter.set_mask((1 << len(rows)) - 1)
+        self.gallery.reset(rows)
+        n = len(rows)
+        self.row_image_ids = [r[2] for r in rows]
+        self.row_names_lower = [r[0].lower() for r in rows]
+
+        # 検索インデックス：画像ごとに問い合わせず、全件を 1 回ずつ引いて振り分ける
+        # （同じ sha256 のファイルは同じ image_id を複数行で共有する）
+        rows_of: dict[int, list[int]] = {}
+        for row, image_id in enumerate(self.row_image_ids):
+            rows_of.setdefault(image_id, []).append(row)
+        tag_rows: dict[str, list[int]] = {}
+        cat_rows: dict[str, list[int]] = {}
+        user_rows: dict[str, list[int]] = {}
+        label_rows: dict[str, list[int]] = {}
+        for r in self.db.all_active_annotations():
+            hit = rows_of.get(r["image_id"])
+            if hit:
+                tag_rows.setdefault(r["name"].lower(), []).extend(hit)
+                cat_rows.setdefault((r["category"] or "").lower(), []).extend(hit)
+                user_rows.setdefault(r["username"].lower(), []).extend(hit)
+        for r in self.db.all_quality_labels():
+            hit = rows_of.get(r["image_id"])
+            if hit:
+                label_rows.setdefault(r["label"].lower(), []).extend(hit)
+        self.tag_rows = {k: _row_mask(v, n) for k, v in tag_rows.items()}
+        self.cat_rows = {k: _row_mask(v, n) for k, v in cat_rows.items()}
+        self.user_rows = {k: _row_mask(v, n) for k, v in user_rows.items()}
+        self.label_rows = {k: _row_mask(v, n) for k, v in label_rows.items()}
+        with_csv = self.db.image_ids_with_csv()
+        self.csv_mask = _row_mask(
+            (row for row, image_id in enumerate(self.row_image_ids) if image_id in with_csv), n
+        )
 
         self.image_tags = self.db.active_tags_map()
 
-    def thumbnail_for(self, path: Path, sha: str) -> QPixmap:
-        THUMB_ROOT.mkdir(parents=True, exist_ok=True)
-        cache = THUMB_ROOT / f"{sha}.jpg"
-        src_mtime = int(path.stat().st_mtime)
-        if cache.exists():
-            try:
-                if int(cache.stat().st_mtime) >= src_mtime:
-                    pm = QPixmap(str(cache))
-                    if not pm.isNull():
-                        return pm
-            except Exception:
-                pass
-        reader = QImageReader(str(path))
-        reader.setAutoTransform(True)
-        img = reader.read()
-        if img.isNull():
-            pm = QPixmap(self.thumb_size, self.thumb_size)
-            pm.fill(Qt.darkGray)
-            return pm
-        pm = QPixmap.fromImage(img)
-        scaled = pm.scaled(
-            self.thumb_size,
-            self.thumb_size,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation,
-        )
-        canvas = QPixmap(self.thumb_size, self.thumb_size)
-        canvas.fill(Qt.darkGray)
-        x = (self.thumb_size - scaled.width()) // 2
-        y = (self.thumb_size - scaled.height()) // 2
-        painter = QPainter(canvas)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
-        painter.drawPixmap(x, y, scaled)
-        painter.end()
-        try:
-            canvas.save(str(cache), "JPG", quality=85)
-            os.utime(cache, (src_mtime, src_mtime))
-        except Exception:
-            pass
-        return canvas
-
     # ===== search =====
     def _parse_date(self, token: str):
         # token like 'date:YYYY-MM-DD..YYYY-MM-DD' or 'date>=YYYY-MM-DD' or 'date<=YYYY-MM-DD' or 'date:YYYY-MM-DD'
@@ -674,59 +1342,48 @@ class MainWindow(QMainWindow):
             else:
                 name_subs.append(tl)
 
-        for rel, item in self.all_items:
-            img_id = item.data(Qt.UserRole + 1)
-            ok = True
-            # filename
-            for s in name_subs:
-                if s not in rel.lower():
-                    ok = False
-                    break
-            if not ok:
-                item.setHidden(True)
-                continue
-            # tag substrings
-            if tag_subs:
-                tlset = self.map_tags_lower.get(img_id, set())
-                if not all(any(s in t for t in tlset) for s in tag_subs):
-                    item.setHidden(True)
-                    continue
-            # category
-            if cats:
-                if not set(cats).issubset(self.map_cats.get(img_id, set())):
-                    item.setHidden(True)
-                    continue
-            # users
-            if users:
-                if not set(users).issubset(self.map_users.get(img_id, set())):
-                    item.setHidden(True)
-                    continue
-            # labels
-            if labels:
-                if not set(labels).issubset(self.map_labels.get(img_id, set())):
-                    item.setHidden(True)
-                    continue
-            # has csv
-            if has_csv is True and not self.map_has_csv.get(img_id, False):
-                item.setHidden(True)
+        # ビットマスクの AND で候補行を絞り込み、残った行だけファイル名と日付を確認する
+        n = len(self.gallery.rows)
+        cand = (1 << n) - 1
+        for s in tag_subs:
+            hits = 0
+            for t, mask in self.tag_rows.items():
+                if s in t:
+                    hits |= mask
+            cand &= hits
+        for c in set(cats):
+            cand &= self.cat_rows.get(c, 0)
+        for u in set(users):
+            cand &= self.user_rows.get(u, 0)
+        for lb in set(labels):
+            cand &= self.label_rows.get(lb, 0)
+        if has_csv is True:
+            cand &= self.csv_mask
+        d1, d2 = date_range
+        shown = []
+        for row in _mask_rows(cand):
+            if not all(s in self.row_names_lower[row] for s in name_subs):
                 continue
-            # date range
-            d1, d2 = date_range
             if d1 or d2:
-                ts = self.map_created_at.get(img_id)
-                if not ts or (d1 and ts < d1) or (d2 and ts >= d2):
-                    item.setHidden(True)
+                ts = self.row_created_at[row]
+                if (d1 and ts < d1) or (d2 and ts >= d2):
                     continue
-            item.setHidden(False)
+            shown.append(row)
+        self.gallery_filter.set_mask(_row_mask(shown, n))
 
     # ===== open =====
-    def open_item(self, item: QListWidgetItem):
-        path = item.data(Qt.UserRole)
+    def open_item(self, index: QModelIndex):
+        path = index.data(Qt.UserRole)
         if path:
             QDesktopServices.openUrl(QUrl.fromLocalFile(path))
 
-    def current_selection(self) -> list[QListWidgetItem]:
-        return self.list.selectedItems()
+    def current_selection(self) -> list[QModelIndex]:
+        return self.list.selectionModel().selectedIndexes()
+
+    def selected_image_ids(self) -> list[int]:
+        # 行番号だけ Qt から受け取り、image_id は Python 側の行データから引く（重複は除く）
+        rows = (self.gallery_filter.mapToSource(ix).row() for ix in self.current_selection())
+        return list(dict.fromkeys(self.row_image_ids[r] for r in rows if r >= 0))
 
     # ===== right panel update =====
     def update_right_panel(self):
@@ -792,13 +1449,17 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "DateNest", "タグ名を入力してください。")
             return
         cat = self.category_combo.currentData() or ""
-        for it in items:
-            img_id = it.data(Qt.UserRole + 1)
-            try:
-                self.db.add_tag_for_user(img_id, tag, self.user_id, category=cat)
-                self.image_tags.setdefault(img_id, set()).add(tag)
-            except sqlite3.IntegrityError as e:
-                QMessageBox.warning(self, "DateNest", f"タグ追加に失敗: {e}")
+        # ダイアログは書き込みロックを放してから出す
+        errors = []
+        with self.db.transaction():
+            for img_id in self.selected_image_ids():
+                try:
+                    self.db.add_tag_for_user(img_id, tag, self.user_id, category=cat)
+                    self.image_tags.setdefault(img_id, set()).add(tag)
+                except sqlite3.IntegrityError as e:
+                    errors.append(f"タグ追加に失敗: {e}")
+        for msg in errors:
+            QMessageBox.warning(self, "DateNest", msg)
         self.completer_model.setStringList(self.db.all_tag_names())
         self.tag_input.clear()
         self.update_right_panel()
@@ -816,9 +1477,9 @@ class MainWindow(QMainWindow):
             return
         tag_name = sel.text().split("  (by")[0].strip()
         cat = sel.data(Qt.UserRole) or ""
-        for it in items:
-            img_id = it.data(Qt.UserRole + 1)
-            self.db.remove_tag_for_user(img_id, tag_name, self.user_id, category=cat)
+        with self.db.transaction():
+            for img_id in self.selected_image_ids():
+                self.db.remove_tag_for_user(img_id, tag_name, self.user_id, category=cat)
         self.update_right_panel()
         if (self.search.text() or "").startswith("#"):
             self.on_search(self.search.text())
@@ -837,13 +1498,9 @@ class MainWindow(QMainWindow):
             return
         path = Path(current.data(Qt.UserRole))
         try:
-            with path.open("r", encoding="utf-8", newline="") as f:
-                reader = csv.reader(f)
-                rows = []
-                for i, row in enumerate(reader):
-                    rows.append(row)
-                    if i >= 49:
-                        break
+            # 先頭だけ読む（ファイル全体は読まない）
+            with path.open("r", encoding="utf-8", errors="replace", newline="") as f:
+                rows = list(islice(csv.reader(f), CSV_PREVIEW_ROWS))
         except Exception as ex:
             QMessageBox.warning(self, "DateNest", f"CSV 読み込み失敗: {ex}")
             return
@@ -860,9 +1517,19 @@ class MainWindow(QMainWindow):
         self.csv_table.setColumnCount(len(header))
         self.csv_table.setHorizontalHeaderLabels(header)
         self.csv_table.setRowCount(len(data))
-        for r, row in enumerate(data):
-            for c, val in enumerate(row):
-                self.csv_table.setItem(r, c, QTableWidgetItem(str(val)))
+        # 埋め終わるまで再描画・シグナル・ソートを止め、列幅の調整も最後に 1 回だけ
+        sorting = self.csv_table.isSortingEnabled()
+        self.csv_table.setSortingEnabled(False)
+        self.csv_table.setUpdatesEnabled(False)
+        self.csv_table.blockSignals(True)
+        try:
+            for r, row in enumerate(data):
+                for c, val in enumerate(row):
+                    self.csv_table.setItem(r, c, QTableWidgetItem(val))
+        finally:
+            self.csv_table.blockSignals(False)
+            self.csv_table.setUpdatesEnabled(True)
+            self.csv_table.setSortingEnabled(sorting)
         self.csv_table.resizeColumnsToContents()
 
     def attach_csv_manual(self):
@@ -879,22 +1546,21 @@ class MainWindow(QMainWindow):
 
     # ===== Export =====
     def export_selection(self, include_images=True, include_attachments=True):
-        items = self.current_selection()
-        if not items:
+        ids = self.selected_image_ids()
+        if not ids:
             QMessageBox.information(self, "DateNest", "画像を選択してください。")
             return
 
-        image_rows = []
-        seen_imgs, seen_atts = set(), set()
-        for it in items:
-            # img_abs = Path(it.data(Qt.UserRole))
-            img_id = it.data(Qt.UserRole + 1)
-            r = self.db.con.execute(
-                "SELECT rel_path, sha256, created_at FROM images WHERE id=?", (img_id,)
-            ).fetchone()
-            if not r:
-                continue
-            row = {
+        # 画像ごとに問い合わせず、選択 id を一時テーブルに入れて種類ごとに 1 回ずつ引く
+        self.db.select_images(ids)
+        rows_by_id = {}
+        # sha256 -> rel_path。zip へ書くときに改めて引かずに済むよう、ここで控えておく
+        seen_imgs: dict[str, str] = {}
+        seen_atts: dict[str, str] = {}
+        for r in self.db.con.execute(
+            "SELECT id, rel_path, sha256, created_at FROM images WHERE id IN _sel"
+        ):
+            rows_by_id[r["id"]] = {
                 "sha256": r["sha256"],
                 "rel_path": r["rel_path"],
                 "created_at": r["created_at"],
@@ -902,42 +1568,50 @@ class MainWindow(QMainWindow):
                 "annotations": [],
                 "quality": [],
             }
-            for a in self.db.get_tags_for_image(img_id):
-                row["annotations"].append(
-                    {
-                        "username": a["username"],
-                        "tag": a["name"],
-                        "category": a["category"],
-                        "created_at": a["created_at"],
-                    }
-                )
-            for q in self.db.con.execute(
-                "SELECT label, score, created_at, u.username FROM quality_votes q JOIN users u ON u.id=q.user_id WHERE image_id=?",
-                (img_id,),
-            ):
-                row["quality"].append(
+            seen_imgs[r["sha256"]] = r["rel_path"]
+        q = """
+        SELECT a.image_id, t.name, t.category, a.created_at, u.username
+          FROM annotations a
+          JOIN tags t ON t.id=a.tag_id
+          JOIN users u ON u.id=a.user_id
+         WHERE a.image_id IN _sel AND a.is_deleted=0
+         ORDER BY a.image_id, t.category, t.name
+        """
+        for a in self.db.con.execute(q):
+            rows_by_id[a["image_id"]]["annotations"].append(
+                {
+                    "username": a["username"],
+                    "tag": a["name"],
+                    "category": a["category"],
+                    "created_at": a["created_at"],
+                }
+            )
+        q = """
+        SELECT q.image_id, q.label, q.score, q.created_at, u.username
+          FROM quality_votes q JOIN users u ON u.id=q.user_id
+         WHERE q.image_id IN _sel
+        """
+        for r in self.db.con.execute(q):
+            rows_by_id[r["image_id"]]["quality"].append(
+                {
+                    "username": r["username"],
+                    "label": r["label"],
+                    "score": r["score"],
+                    "created_at": r["created_at"],
+                }
+            )
+        if include_attachments:
+            q = "SELECT image_id, kind, rel_path, sha256 FROM attachments WHERE image_id IN _sel"
+            for att in self.db.con.execute(q):
+                rows_by_id[att["image_id"]]["attachments"].append(
                     {
-                        "username": q["username"],
-                        "label": q["label"],
-                        "score": q["score"],
-                        "created_at": q["created_at"],
+                        "kind": att["kind"],
+                        "sha256": att["sha256"],
+                        "ext": _safe_ext(att["rel_path"]),
                     }
                 )
-            if include_attachments:
-                for att in self.db.con.execute(
-                    "SELECT kind, rel_path, sha256 FROM attachments WHERE image_id=?",
-                    (img_id,),
-                ):
-                    row["attachments"].append(
-                        {
-                            "kind": att["kind"],
-                            "sha256": att["sha256"],
-                            "ext": _safe_ext(att["rel_path"]),
-                        }
-                    )
-                    seen_atts.add(att["sha256"])
-            image_rows.append(row)
-            seen_imgs.add(r["sha256"])
+                seen_atts[att["sha256"]] = att["rel_path"]
+        image_rows = [rows_by_id[i] for i in ids if i in rows_by_id]
 
         manifest = {
             "version": 1,
@@ -969,27 +1643,30 @@ class MainWindow(QMainWindow):
         if not path:
             return
         with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
-            z.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+            z.writestr(
+                "manifest.json",
+                _dump_manifest(manifest),
+                compress_type=zipfile.ZIP_DEFLATED,
+                compresslevel=1,
+            )
             if include_images:
-                for sha in seen_imgs:
-                    r = self.db.con.execute(
-                        "SELECT rel_path FROM images WHERE sha256=?", (sha,)
-                    ).fetchone()
-                    if not r:
-                        continue
-                    src = self.root / r["rel_path"]
+                for sha, rel in seen_imgs.items():
+                    src = self.root / rel
                     if src.exists():
-                        z.write(src, arcname=f"images/{sha}{_safe_ext(src.name)}")
+                        z.write(
+                            src,
+                            arcname=f"images/{sha}{_safe_ext(src.name)}",
+                            compress_type=_zip_compress_type(src.name),
+                        )
             if include_attachments:
-                for sha in seen_atts:
-                    r = self.db.con.execute(
-                        "SELECT rel_path FROM attachments WHERE sha256=?", (sha,)
-                    ).fetchone()
-                    if not r:
-                        continue
-                    src = self.root / r["rel_path"]
+                for sha, rel in seen_atts.items():
+                    src = self.root / rel
                     if src.exists():
-                        z.write(src, arcname=f"attachments/{sha}{_safe_ext(src.name)}")
+                        z.write(
+                            src,
+                            arcname=f"attachments/{sha}{_safe_ext(src.name)}",
+                            compress_type=_zip_compress_type(src.name),
+                        )
         QMessageBox.information(self, "DateNest", f"エクスポート完了{path}")
 
     # ===== Import =====
@@ -999,68 +1676,71 @@ class MainWindow(QMainWindow):
         )
         if not path:
             return
-        with zipfile.ZipFile(path, "r") as z:
-            try:
-                manifest = json.loads(z.read("manifest.json").decode("utf-8"))
-            except Exception as e:
-                QMessageBox.critical(self, "DateNest", f"manifest.json が読めません: {e}")
-                return
-
-            for u in manifest.get("users", []):
-                self.db.ensure_user(u.get("username"), u.get("display_name"))
-            for t in manifest.get("tags", []):
-                self.db.upsert_tag(t.get("name", ""), t.get("category", ""), t.get("description"))
-
-            for im in manifest.get("images", []):
-                sha = im["sha256"]
-                r = self.db.con.execute("SELECT id FROM images WHERE sha256=?", (sha,)).fetchone()
-                if r:
-                    img_id = r["id"]
-                else:
-                    member = f"images/{sha}{_safe_ext(im.get('rel_path', ''))}"
-                    if member in z.namelist():
-                        dst_dir = _ingest_target_dir(self.root, "imported")
-                        dst = dst_dir / Path(member).name
-                        with z.open(member) as src, open(dst, "wb") as out:
-                            shutil.copyfileobj(src, out)
-                        rel = dst.relative_to(self.root).as_posix()
-                        ts = im.get("created_at")
-                        img_id = self.db.upsert_image(rel, sha, ts)
-                    else:
-                        continue
-
-                for att in im.get("attachments", []):
-                    a_sha, ext = att["sha256"], att.get("ext", ".bin")
-                    r2 = self.db.con.execute(
-                        "SELECT id FROM attachments WHERE sha256=?", (a_sha,)
-                    ).fetchone()
-                    if not r2 and f"attachments/{a_sha}{ext}" in z.namelist():
-                        dst_dir = _ingest_target_dir(self.root, "attachments_imported")
-                        dst = dst_dir / f"{a_sha}{ext}"
-                        with z.open(f"attachments/{a_sha}{ext}") as src, open(dst, "wb") as out:
-                            shutil.copyfileobj(src, out)
-                        rel = dst.relative_to(self.root).as_posix()
-                        self.db.upsert_attachment(img_id, att.get("kind", "csv"), rel, a_sha, None)
-
-                for an in im.get("annotations", []):
-                    uid = self.db.ensure_user(an.get("username"))
-                    self.db.add_tag_for_user(
-                        img_id, an.get("tag", ""), uid, category=an.get("category", "")
-                    )
-                for q in im.get("quality", []):
-                    uid = self.db.ensure_user(q.get("username"))
-                    self.db.upsert_quality(
-                        img_id,
-                        uid,
-                        q.get("label", "review"),
-                        q.get("score"),
-                        q.get("created_at"),
-                    )
+        # 展開と DB 書き込みは別スレッドの _ImportWorker（専用の DB 接続）で行い、UI は止めない
+        # その間 GUI 側の書き込み操作は止める（ロック待ちで固まらないように）
+        self._set_writes_enabled(False)
+        self.statusBar().showMessage("インポート中…")
+        self._import_thread = QThread(self)
+        self._import_worker = _ImportWorker(path, self.root, self.db.db_path)
+        self._import_worker.moveToThread(self._import_thread)
+        self._import_thread.started.connect(self._import_worker.run)
+        # 受け側は MainWindow のメソッドにして、UI の更新が GUI スレッドで走るようにする
+        self._import_worker.progress.connect(self._on_import_progress)
+        self._import_worker.finished.connect(self._on_import_finished)
+        self._import_worker.failed.connect(self._on_import_failed)
+        self._import_thread.finished.connect(self._import_worker.deleteLater)
+        self._import_thread.finished.connect(self._import_thread.deleteLater)
+        self._import_thread.start()
+
+    def _on_import_progress(self, done: int, total: int):
+        self.statusBar().showMessage(f"インポート中… {done}/{total}")
+
+    def _set_writes_enabled(self, enabled: bool):
+        for b in (
+            self.btn_add,
+            self.btn_del,
+            self.btn_q_good,
+            self.btn_q_review,
+            self.btn_q_bad,
+            self.btn_rescan,
+            self.btn_attach,
+            self.btn_import,
+        ):
+            b.setEnabled(enabled)
+        for sc in self._write_shortcuts:
+            sc.setEnabled(enabled)
+
+    def _end_import(self):
+        # run() は signal を出した直後に戻るので、スレッドを止めて待ってから操作を戻す
+        self._import_thread.quit()
+        self._import_thread.wait()
+        self._import_thread = None
+        self._set_writes_enabled(True)
+        self.statusBar().clearMessage()
+
+    def closeEvent(self, e: QCloseEvent):
+        # 実行中の QThread を破棄しないよう、インポートが終わるまでは閉じない
+        if self._import_thread is not None:
+            QMessageBox.information(self, "DateNest", "インポート中です。完了後に閉じてください。")
+            e.ignore()
+            return
+        # 閉じるときに PRAGMA optimize（DB.close）で、増えた表の統計を取り直す
+        self.db.close()
+        super().closeEvent(e)
 
+    def _on_import_finished(self):
+        self._end_import()
         self.reload_all()
         self.update_right_panel()
         QMessageBox.information(self, "DateNest", "インポート完了")
 
+    def _on_import_failed(self, msg: str):
+        # 失敗しても途中までの画像・添付などは書き込まれているので、表示は取り直す
+        self._end_import()
+        self.reload_all()
+        self.update_right_panel()
+        QMessageBox.critical(self, "DateNest", msg)
+
 
 if __name__ == "__main__":
     import traceback
@@ -26,14 +26,61 @@ CREATE TABLE IF NOT EXISTS file_tags (
 CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files(sha256);
 """
 
+# Schema changes applied on top of SCHEMA, tracked with PRAGMA user_version.
+# MIGRATIONS[i] upgrades a database from version i to i + 1.
+MIGRATIONS = [
+    # 1: xxh3-128 content hash for the fast dedup path (importer.import_files)
+    """
+    ALTER TABLE files ADD COLUMN content_hash TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash);
+    """,
+]
 
-def connect(db_path: Path) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+
+def connect(db_path: Path, bulk: bool = False) -> sqlite3.Connection:
+    """
+    Open the database and make sure the schema exists.
+
+    With ``bulk=True`` the connection trades durability of the last commits for
+    fewer fsyncs (synchronous=NORMAL, still crash-safe under WAL); meant for
+    import jobs.
+    """
+    conn = sqlite3.connect(db_path, cached_statements=256)
     conn.execute("PRAGMA foreign_keys=ON;")
     conn.executescript(SCHEMA)
+    _migrate(conn)
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-65536;")  # 64 MiB
+    conn.execute("PRAGMA mmap_size=268435456;")  # 256 MiB
+    if bulk:
+        conn.execute("PRAGMA synchronous=NORMAL;")
     return conn
 
 
+def _migrate(conn: sqlite3.Connection) -> None:
+    for version, script in enumerate(MIGRATIONS, start=1):
+        if _user_version(conn) >= version:
+            continue
+        # Another process may have migrated between the check above and taking
+        # the write lock, so check again while holding it. The statements run
+        # one by one because executescript() would commit this transaction first.
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            if _user_version(conn) < version:
+                for stmt in script.split(";"):
+                    if stmt.strip():
+                        conn.execute(stmt)
+                conn.execute(f"PRAGMA user_version={version};")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def _user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
 def get_or_create_tag_id(conn: sqlite3.Connection, name: str) -> int:
     cur = conn.execute("SELECT id FROM tags WHERE name = ?", (name,))
     row = cur.fetchone()
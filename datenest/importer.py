@@ -2,59 +2,127 @@ from __future__ import annotations
 
 import hashlib
 import os
-from collections.abc import Iterable, Sequence
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 from .db import connect, get_or_create_tag_id
 
+try:
+    import xxhash
+except ImportError:  # optional; without it import_files always dedups by sha256
+    xxhash = None
 
-def sha256sum(path: Path, bufsize: int = 1024 * 1024) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(bufsize), b""):
-            h.update(chunk)
-    return h.hexdigest()
+# insert and fetch the id in one statement (SQLite 3.35+ RETURNING);
+# a duplicate sha256 returns no row, so only then look the id up
+_INSERT_FILE = (
+    "INSERT INTO files(path, sha256, size, content_hash) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(sha256) DO NOTHING RETURNING id"
+)
+_SELECT_FILE_ID = "SELECT id FROM files WHERE sha256 = ?"
+# rows imported before the content_hash column get it the first time they are matched
+_BACKFILL_CONTENT_HASH = "UPDATE files SET content_hash = ? WHERE id = ? AND content_hash IS NULL"
+# UNIQUE(file_id, tag_id) prevents dup links
+_LINK_TAG = "INSERT OR IGNORE INTO file_tags(file_id, tag_id) VALUES (?, ?)"
+
+
+def sha256sum(path: Path) -> str:
+    # file_digest runs the read/update loop in C with a reused buffer
+    with path.open("rb", buffering=0) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def content_hash(path: Path) -> str:
+    """
+    xxh3-128 of the file contents (requires the optional ``xxhash`` package).
+
+    Only used to spot duplicates quickly; sha256 stays the identifier that
+    archives and other libraries see.
+    """
+    with path.open("rb", buffering=0) as f:
+        return hashlib.file_digest(f, xxhash.xxh3_128).hexdigest()
+
+
+def _pool_map(fn: Callable, files: Iterable[Path], max_workers: int | None = None) -> Iterator:
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        for item in ex.map(fn, files):
+            if item is not None:
+                yield item
+
+
+def _hash_file(p: Path) -> tuple[Path, str, int] | None:
+    if not p.exists() or not p.is_file():
+        return None
+    return p, sha256sum(p), os.path.getsize(p)
+
+
+def hash_files(
+    files: Iterable[Path], max_workers: int | None = None
+) -> Iterator[tuple[Path, str, int]]:
+    """
+    Yield (path, sha256, size) for each existing regular file, in input order.
+
+    Hashing runs on a thread pool (hashlib releases the GIL while digesting),
+    so disk reads and hashing of several files overlap.
+    """
+    yield from _pool_map(_hash_file, files, max_workers)
+
+
+def _fast_hash_file(p: Path, known: Mapping[str, int]) -> tuple[Path, str | None, int, str] | None:
+    if not p.exists() or not p.is_file():
+        return None
+    ch = content_hash(p)
+    # a content hash that is already in the library means a duplicate: skip sha256
+    digest = None if ch in known else sha256sum(p)
+    return p, digest, os.path.getsize(p), ch
 
 
 def import_files(
     db_path: Path,
     files: Iterable[Path],
     tags: Sequence[str] = (),
+    fast_dedup: bool = False,
 ) -> dict:
     """
     Returns stats: {"inserted": n_new, "duplicates": n_dup, "tag_links": n_links}
+
+    With ``fast_dedup=True`` (and ``xxhash`` installed) each file is first
+    hashed with xxh3; files whose content hash is already in the library are
+    counted as duplicates without computing sha256.
     """
-    conn = connect(db_path)
+    conn = connect(db_path, bulk=True)
     inserted = duplicates = links = 0
     try:
         with conn:  # transaction
             tag_ids = [get_or_create_tag_id(conn, t.strip()) for t in tags if t.strip()]
-            for p in files:
-                if not p.exists() or not p.is_file():
-                    continue
-                digest = sha256sum(p)
-                size = os.path.getsize(p)
-
-                # try insert file (unique by sha256)
-                cur = conn.execute(
-                    "INSERT OR IGNORE INTO files(path, sha256, size) VALUES (?, ?, ?)",
-                    (str(p), digest, size),
-                )
-                if cur.rowcount == 1:
-                    inserted += 1
-                    cur = conn.execute("SELECT id FROM files WHERE sha256 = ?", (digest,))
-                    file_id = cur.fetchone()[0]
-                else:
+            # one cursor for the whole loop; the statements come from the connection's cache
+            cur = conn.cursor()
+            # hashing happens on worker threads; all DB writes stay on this thread
+            if fast_dedup and xxhash is not None:
+                q = "SELECT content_hash, id FROM files WHERE content_hash IS NOT NULL"
+                known = dict(cur.execute(q).fetchall())
+                hashed = _pool_map(partial(_fast_hash_file, known=known), files)
+            else:
+                known = {}
+                hashed = ((p, digest, size, None) for p, digest, size in hash_files(files))
+            for p, digest, size, ch in hashed:
+                if digest is None:
                     duplicates += 1
-                    cur = conn.execute("SELECT id FROM files WHERE sha256 = ?", (digest,))
-                    file_id = cur.fetchone()[0]
-
-                # link tags (UNIQUE(file_id, tag_id) prevents dup links)
-                for tid in tag_ids:
-                    cur = conn.execute(
-                        "INSERT OR IGNORE INTO file_tags(file_id, tag_id) VALUES (?, ?)",
-                        (file_id, tid),
-                    )
+                    file_id = known[ch]
+                else:
+                    row = cur.execute(_INSERT_FILE, (str(p), digest, size, ch)).fetchone()
+                    if row is not None:
+                        inserted += 1
+                        file_id = row[0]
+                    else:
+                        duplicates += 1
+                        file_id = cur.execute(_SELECT_FILE_ID, (digest,)).fetchone()[0]
+                        if ch is not None:
+                            cur.execute(_BACKFILL_CONTENT_HASH, (ch, file_id))
+
+                if tag_ids:
+                    cur.executemany(_LINK_TAG, [(file_id, tid) for tid in tag_ids])
                     links += cur.rowcount
     finally:
         conn.close()
@@ -85,6 +85,11 @@ CREATE TABLE IF NOT EXISTS authoritative(
   FOREIGN KEY(run_id) REFERENCES runs(id)
 );
 
+-- 画像単位の JOIN / 絞り込み用（名前と定義は app.py の INDEX_DDL と揃える）
+-- quality_votes(image_id) は UNIQUE(image_id, user_id) の先頭列で足りる
+CREATE INDEX IF NOT EXISTS idx_attachments_image_kind ON attachments(image_id, kind);
+CREATE INDEX IF NOT EXISTS idx_annotations_image_active ON annotations(image_id) WHERE is_deleted=0;
+
 -- 1画像あたり最大5人までの注釈を許可（is_deleted=0 の DISTINCT user_id を数える）
 CREATE TRIGGER IF NOT EXISTS trg_limit_annotators
 BEFORE INSERT ON annotations
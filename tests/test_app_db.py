@@ -0,0 +1,58 @@
+import runpy
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from app import DB  # noqa: E402
+
+DDL = runpy.run_path(str(Path(__file__).parents[1] / "scripts" / "init_db.py"))["DDL"]
+
+
+@pytest.fixture
+def db(tmp_path: Path):
+    path = tmp_path / "db.sqlite3"
+    con = sqlite3.connect(path)
+    con.executescript(DDL)
+    con.execute("INSERT INTO images(rel_path, sha256) VALUES ('a.png', 'a'), ('b.png', 'b')")
+    con.commit()
+    con.close()
+    d = DB(str(path))
+    yield d
+    d.close()
+
+
+def _setup(db: DB, n_users: int):
+    uids = db.ensure_users({f"u{i}": None for i in range(7)})
+    tags = db.upsert_tags({("t1", ""): None, ("t2", ""): None})
+    t1, t2 = tags[("t1", "")], tags[("t2", "")]
+    with db.transaction():
+        for i in range(n_users):
+            db.add_tag_for_user(1, "t1", uids[f"u{i}"])
+    return uids, t1, t2
+
+
+def test_add_annotations_rejects_new_row_on_full_image(db: DB):
+    # 5 人付いた画像には、既にいる人の新しいタグでも追加できない。トリガーと同じ規則
+    uids, t1, t2 = _setup(db, 5)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_tag_for_user(1, "t2", uids["u0"])
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_annotations([(2, t1, uids["u0"]), (1, t2, uids["u0"])])
+    assert db.con.execute("SELECT COUNT(*) FROM annotations").fetchone()[0] == 5
+    db.add_annotations([(1, t1, uids["u1"])])  # 既存の行はそのまま通る
+
+
+def test_add_annotations_rejects_batch_that_fills_image(db: DB):
+    # 4 人の画像に 1 人目で 5 人になった後の行は、既にいる人でも弾かれる
+    uids, t1, t2 = _setup(db, 4)
+    assert db.over_limit_images([(1, t1, uids["u4"]), (1, t2, uids["u0"])]) == {1}
+    assert db.over_limit_images([(1, t1, uids["u4"]), (1, t1, uids["u4"])]) == set()
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_annotations([(1, t1, uids["u4"]), (1, t1, uids["u5"])])
+    db.add_annotations([(1, t1, uids["u4"]), (2, t1, uids["u5"])])
+    n = db.con.execute("SELECT COUNT(DISTINCT user_id) FROM annotations WHERE image_id=1")
+    assert n.fetchone()[0] == 5
+    assert db.con.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='trigger'").fetchone()[0]
@@ -1,6 +1,10 @@
+import sqlite3
 from pathlib import Path
 
-from datenest.importer import import_files
+import pytest
+
+from datenest.db import SCHEMA, _migrate, connect
+from datenest.importer import hash_files, import_files, sha256sum
 
 
 def test_dedup(tmp_path: Path):
@@ -15,3 +19,91 @@ def test_dedup(tmp_path: Path):
 
     assert s1["inserted"] == 1 and s1["duplicates"] == 0
     assert s2["inserted"] == 0 and s2["duplicates"] == 1
+
+
+def test_duplicates_within_one_batch_share_tag_links(tmp_path: Path):
+    f1 = tmp_path / "a.txt"
+    f1.write_text("hello")
+    f2 = tmp_path / "b.txt"
+    f2.write_text("hello")
+
+    db = tmp_path / "t.db"
+    s = import_files(db, [f1, f2], tags=["t1", "t2"])
+
+    assert s == {"inserted": 1, "duplicates": 1, "tag_links": 2}
+
+
+def test_hash_files_keeps_order_and_skips_missing(tmp_path: Path):
+    files = []
+    for i in range(8):
+        f = tmp_path / f"{i}.txt"
+        f.write_text(str(i) * (i + 1))
+        files.append(f)
+    missing = tmp_path / "missing.txt"
+
+    out = list(hash_files([*files[:4], missing, tmp_path, *files[4:]], max_workers=3))
+
+    assert [p for p, _, _ in out] == files
+    assert all(d == sha256sum(p) and s == p.stat().st_size for p, d, s in out)
+
+
+def test_connect_migrates_old_schema(tmp_path: Path):
+    db = tmp_path / "t.db"
+    old = sqlite3.connect(db)
+    old.executescript(SCHEMA)
+    old.execute("INSERT INTO files(path, sha256, size) VALUES ('a', 'x', 1)")
+    old.commit()
+    old.close()
+
+    conn = connect(db)
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(files)")]
+    assert "content_hash" in cols
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert conn.execute("SELECT sha256, content_hash FROM files").fetchall() == [("x", None)]
+    conn.close()
+    connect(db).close()  # already migrated: no-op
+
+
+class _StaleVersionConnection(sqlite3.Connection):
+    # Reports user_version 0 on the first read, as if another process migrated
+    # the database right after this connection looked.
+    stale = True
+
+    def execute(self, sql, *args):
+        if self.stale and sql.startswith("PRAGMA user_version"):
+            self.stale = False
+            return super().execute("SELECT 0")
+        return super().execute(sql, *args)
+
+
+def test_migrate_rechecks_version_under_write_lock(tmp_path: Path):
+    db = tmp_path / "t.db"
+    connect(db).close()
+
+    conn = sqlite3.connect(db, factory=_StaleVersionConnection)
+    _migrate(conn)  # must not re-run ALTER TABLE ADD COLUMN
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert not conn.in_transaction
+    conn.close()
+
+
+def test_fast_dedup_skips_sha256_for_known_content(tmp_path: Path, monkeypatch):
+    pytest.importorskip("xxhash")
+    f1 = tmp_path / "a.txt"
+    f1.write_text("hello")
+    f2 = tmp_path / "b.txt"
+    f2.write_text("hello")
+
+    db = tmp_path / "t.db"
+    s1 = import_files(db, [f1], tags=["t1"])  # sha256 only: no content hash yet
+    s2 = import_files(db, [f2], fast_dedup=True)  # backfills the content hash
+
+    def no_sha(_p):
+        raise AssertionError("sha256 computed for a known file")
+
+    monkeypatch.setattr("datenest.importer.sha256sum", no_sha)
+    s3 = import_files(db, [f1, f2], tags=["t1"], fast_dedup=True)
+
+    assert s1["inserted"] == 1
+    assert s2 == {"inserted": 0, "duplicates": 1, "tag_links": 0}
+    assert s3 == {"inserted": 0, "duplicates": 2, "tag_links": 0}